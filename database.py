@@ -5,7 +5,9 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
+from pymongo.read_preferences import ReadPreference
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -22,11 +24,42 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # One shared client for the process. zstd/snappy are negotiated at the
+    # handshake and typically cut 30-60% of the bytes on text-heavy product
+    # documents; unsupported compressors are simply skipped.
+    _client = AsyncIOMotorClient(
+        database_url,
+        maxPoolSize=100,
+        minPoolSize=10,
+        compressors="zstd,snappy",
+        appname="protein-store",
+    )
     db = _client[database_name]
 
+# The catalog tolerates eventual consistency: product reads may hit a
+# secondary and product writes skip the journal ack. Orders and everything
+# else keep the client defaults.
+_RELAXED_COLLECTIONS = {"product"}
+
+def _collection_for_writes(collection_name: str):
+    coll = db[collection_name]
+    if collection_name in _RELAXED_COLLECTIONS:
+        coll = coll.with_options(write_concern=WriteConcern(w=1, j=False))
+    return coll
+
+def _collection_for_reads(collection_name: str):
+    coll = db[collection_name]
+    if collection_name in _RELAXED_COLLECTIONS:
+        coll = coll.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+    return coll
+
+def close_db():
+    """Close the shared Mongo client (called from the app's shutdown hook)"""
+    if _client is not None:
+        _client.close()
+
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,16 +73,50 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await _collection_for_writes(collection_name).insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def create_documents(collection_name: str, docs: list):
+    """Insert many documents with timestamps in a single roundtrip"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    data_dicts = []
+    for doc in docs:
+        data_dict = doc.model_dump() if isinstance(doc, BaseModel) else doc.copy()
+        data_dict['created_at'] = now
+        data_dict['updated_at'] = now
+        data_dicts.append(data_dict)
+
+    result = await _collection_for_writes(collection_name).insert_many(data_dicts, ordered=False)
+    return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+def get_documents_cursor(collection_name: str, filter_dict: dict = None, limit: int = None,
+                         projection: dict = None, sort: list = None, hint: str = None,
+                         batch_size: int = None):
+    """Build a find cursor without draining it (for streaming large result sets)"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-    
-    cursor = db[collection_name].find(filter_dict or {})
+
+    cursor = _collection_for_reads(collection_name).find(filter_dict or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
     if limit:
         cursor = cursor.limit(limit)
-    
-    return list(cursor)
+    if hint:
+        # Pin a known-good index so the planner does not re-evaluate candidates
+        # on every call.
+        cursor = cursor.hint(hint)
+    if batch_size:
+        cursor = cursor.batch_size(batch_size)
+
+    return cursor
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None,
+                        projection: dict = None, sort: list = None, hint: str = None,
+                        batch_size: int = None):
+    """Get documents from collection"""
+    cursor = get_documents_cursor(collection_name, filter_dict, limit, projection, sort,
+                                  hint, batch_size)
+    return await cursor.to_list(length=limit)
@@ -1,29 +1,145 @@
+import asyncio
+import hashlib
 import os
+import re
+import orjson
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from bson import ObjectId
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+from bson import ObjectId, Regex
+from pymongo import IndexModel
 
-from database import db, create_document, get_documents
+from database import db, close_db, create_document, create_documents, get_documents, get_documents_cursor
 from schemas import Product, Order, OrderItem, User
 
-app = FastAPI(title="Protein Store API")
+async def ensure_indexes():
+    """Create the search indexes up front so queries never fall back to collection scans"""
+    if db is None:
+        return
+    # Batched in one createIndexes command. MongoDB permits a single text index
+    # per collection, so a compound (category, text) index cannot coexist with
+    # product_text. category+q queries therefore scan product_text entries with
+    # category applied as a post-filter — not bounded by the equality; the
+    # plain category index only serves category-only listings.
+    await db["product"].create_indexes([
+        IndexModel(
+            [("title", "text"), ("description", "text"), ("tags", "text")],
+            weights={"title": 10, "tags": 5, "description": 1},
+            name="product_text",
+        ),
+        IndexModel([("title_lc", 1)], name="title_lc_1"),
+        IndexModel([("category", 1)], name="category_1"),
+    ])
 
+async def backfill_shadow_fields():
+    """Populate title_lc on documents written outside the API (e.g. the Flames
+    viewer does CRUD directly against the collection), otherwise the prefix
+    fast path silently drops them from single-token searches."""
+    if db is None:
+        return
+    await db["product"].update_many(
+        {"title_lc": {"$exists": False}},
+        [{"$set": {"title_lc": {"$toLower": "$title"}}}],
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    await backfill_shadow_fields()
+    yield
+    close_db()
+
+app = FastAPI(title="Protein Store API", lifespan=lifespan,
+              default_response_class=ORJSONResponse)
+
+# Listing responses never render the (potentially large) description, so skip
+# shipping and decoding it; get_product keeps the full document.
+LIST_PROJECTION = {
+    "title": 1,
+    "price": 1,
+    "category": 1,
+    "in_stock": 1,
+    "image": 1,
+    "protein_grams": 1,
+    "calories": 1,
+    "tags": 1,
+}
+
+# Query-shape patterns, compiled once at import instead of per request.
+_PREFIX_RE = re.compile(r"^[a-z0-9]+$")
+_QUOTED_RE = re.compile(r'"([^"]*)"')
+_OBJECTID_RE = re.compile(r"^[0-9a-f]{24}$")
+
+# Pages up to this size are materialized (and cached); anything larger is
+# streamed as NDJSON directly off the Mongo cursor.
+STREAM_THRESHOLD = 50
+
+async def stream_product_docs(cursor):
+    async for d in cursor:
+        if d.get("_id"):
+            d["id"] = str(d.pop("_id"))
+        yield orjson.dumps(d) + b"\n"
+
+# Conditional-request support: intermediaries and browsers revalidate with
+# If-None-Match and skip the body entirely on a 304.
+LIST_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+PRODUCT_CACHE_CONTROL = "public, max-age=300, stale-while-revalidate=300"
+
+def _etag_response(request: Request, body: dict, etag: str, cache_control: str):
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(body, headers=headers)
+
+# In-process response caches: listings change rarely, so hits skip the Mongo
+# roundtrip and BSON decode entirely. Writes bump _cache_version, which is part
+# of every listing key, so stale entries simply stop being reachable.
+_list_cache = TTLCache(maxsize=1024, ttl=60)
+_product_cache = TTLCache(maxsize=4096, ttl=300)
+_cache_version = 0
+
+def _list_cache_key(category, q, limit):
+    raw = f"{_cache_version}|{category}|{q}|{limit}".encode()
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+def invalidate_product_caches():
+    global _cache_version
+    _cache_version += 1
+    _product_cache.clear()
+
+def product_to_doc(product: Product) -> dict:
+    """Dump a Product and add the lowercase shadow fields backing the prefix index"""
+    doc = product.model_dump()
+    doc["title_lc"] = product.title.lower()
+    doc["tags_lc"] = [t.lower() for t in product.tags] if product.tags else []
+    return doc
+
+# With credentials disabled the middleware can answer every origin with a
+# static Access-Control-Allow-Origin: * instead of echoing the request Origin
+# per request; this public API never uses cookies.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
-    allow_credentials=True,
+    allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Protein Store Backend is running"}
 
+# Load-balancer probes hit /test every few seconds; listing collections on
+# each probe is wasted Mongo traffic, so liveness is a cheap bounded ping and
+# the collection list is only fetched on ?full=1 (and then cached for 30s).
+_collections_cache = TTLCache(maxsize=1, ttl=30)
+
 @app.get("/test")
-def test_database():
+async def test_database(full: bool = False):
     """Test endpoint to check if database is available and accessible"""
     response = {
         "backend": "✅ Running",
@@ -42,9 +158,14 @@ def test_database():
             response["connection_status"] = "Connected"
 
             try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
+                await asyncio.wait_for(db.command({"ping": 1}), timeout=0.5)
                 response["database"] = "✅ Connected & Working"
+                if full:
+                    collections = _collections_cache.get("names")
+                    if collections is None:
+                        collections = await db.list_collection_names()
+                        _collections_cache["names"] = collections
+                    response["collections"] = collections[:10]
             except Exception as e:
                 response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
         else:
@@ -53,7 +174,6 @@ def test_database():
     except Exception as e:
         response["database"] = f"❌ Error: {str(e)[:50]}"
 
-    import os
     response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
     response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
 
@@ -62,117 +182,179 @@ def test_database():
 # ---------------------- Products ----------------------
 
 @app.post("/api/products", response_model=dict)
-def create_product(product: Product):
+async def create_product(product: Product):
     try:
-        product_id = create_document("product", product)
+        product_id = await create_document("product", product_to_doc(product))
+        invalidate_product_caches()
         return {"id": product_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/products/bulk", response_model=dict)
+async def create_products_bulk(products: List[Product]):
+    try:
+        inserted_ids = await create_documents("product", [product_to_doc(p) for p in products])
+        invalidate_product_caches()
+        return {"ids": inserted_ids}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 class ProductQuery(BaseModel):
     category: Optional[str] = None
     q: Optional[str] = None
     limit: Optional[int] = 50
 
 @app.get("/api/products")
-def list_products(category: Optional[str] = None, q: Optional[str] = None, limit: int = 50):
+async def list_products(request: Request, category: Optional[str] = None, q: Optional[str] = None, limit: int = 50):
     try:
         filter_dict = {}
+        projection = dict(LIST_PROJECTION)
+        sort = None
+        hint = None
         if category:
             filter_dict["category"] = category
         if q:
-            filter_dict["$or"] = [
-                {"title": {"$regex": q, "$options": "i"}},
-                {"description": {"$regex": q, "$options": "i"}},
-                {"tags": {"$regex": q, "$options": "i"}},
-            ]
-        docs = get_documents("product", filter_dict, limit)
-        # Convert ObjectId
-        for d in docs:
-            if d.get("_id"):
-                d["id"] = str(d.pop("_id"))
-        return {"items": docs}
+            # Quoted sub-token phrases (e.g. '"wh"') are below the text-index token
+            # boundary, so only those still need the old regex scan.
+            quoted = _QUOTED_RE.findall(q)
+            if _PREFIX_RE.match(q.lower()):
+                # Single-token queries (e.g. autocomplete "whe") become an anchored,
+                # case-sensitive prefix regex so MongoDB range-scans the title_lc index.
+                filter_dict["title_lc"] = {"$regex": f"^{re.escape(q.lower())}"}
+                hint = "title_lc_1"
+            elif quoted and any(len(part) < 3 for part in quoted):
+                # One escaped pattern, compiled client-side and shared by all
+                # three clauses; escaping also closes off regex injection.
+                pat = Regex(re.escape(q), "i")
+                filter_dict["$or"] = [
+                    {"title": pat},
+                    {"description": pat},
+                    {"tags": pat},
+                ]
+            else:
+                filter_dict["$text"] = {"$search": q}
+                projection["score"] = {"$meta": "textScore"}
+                sort = [("score", {"$meta": "textScore"})]
+        if limit and limit > STREAM_THRESHOLD:
+            # Large pages: stream NDJSON straight off the cursor so we never
+            # materialize the whole page or walk it a second time.
+            cursor = get_documents_cursor("product", filter_dict, limit,
+                                          projection=projection, sort=sort, hint=hint)
+            return StreamingResponse(stream_product_docs(cursor),
+                                     media_type="application/x-ndjson")
+        cache_key = _list_cache_key(category, q, limit)
+        cached = _list_cache.get(cache_key)
+        if cached is None:
+            docs = await get_documents("product", filter_dict, limit, projection=projection, sort=sort, hint=hint)
+            # Convert ObjectId
+            for d in docs:
+                if d.get("_id"):
+                    d["id"] = str(d.pop("_id"))
+            result = {"items": docs}
+            # RFC 9110 entity-tags are DQUOTE-delimited; bare tokens get
+            # dropped or normalized by strict intermediaries.
+            etag = f'"{hashlib.blake2b(orjson.dumps(result)).hexdigest()[:16]}"'
+            cached = (result, etag)
+            _list_cache[cache_key] = cached
+        result, etag = cached
+        return _etag_response(request, result, etag, LIST_CACHE_CONTROL)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/products/{product_id}")
-def get_product(product_id: str):
-    try:
-        docs = get_documents("product", {"_id": ObjectId(product_id)}, 1)
+async def get_product(request: Request, product_id: str):
+    # Reject malformed ids up front: no InvalidId raise/catch cycle, and the
+    # caller gets a 400 instead of a misleading 500.
+    if not _OBJECTID_RE.match(product_id):
+        raise HTTPException(status_code=400, detail="Invalid product id")
+    cached = _product_cache.get(product_id)
+    if cached is None:
+        try:
+            docs = await get_documents("product", {"_id": ObjectId(product_id)}, 1, batch_size=1)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
         if not docs:
             raise HTTPException(status_code=404, detail="Product not found")
         d = docs[0]
         d["id"] = str(d.pop("_id"))
-        return d
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        # id + updated_at uniquely identify a document revision, so the ETag
+        # needs no serialization pass over the body.
+        raw = f"{product_id}|{d.get('updated_at')}".encode()
+        etag = f'"{hashlib.blake2b(raw).hexdigest()[:16]}"'
+        cached = (d, etag)
+        _product_cache[product_id] = cached
+    d, etag = cached
+    return _etag_response(request, d, etag, PRODUCT_CACHE_CONTROL)
 
 # ---------------------- Seed sample products ----------------------
 
+# Validated once at import; seeding reuses the ready-to-insert dicts instead of
+# re-running Pydantic validation on every /api/seed call.
+SAMPLE_PRODUCTS = tuple(product_to_doc(p) for p in TypeAdapter(List[Product]).validate_python([
+    {
+        "title": "Protein Pizza (100g Protein)",
+        "description": "Stone-baked high-protein pizza with 100g protein per pie. Crispy crust, low-carb.",
+        "price": 14.99,
+        "category": "food",
+        "in_stock": True,
+        "image": "https://images.unsplash.com/photo-1542281286-9e0a16bb7366",
+        "protein_grams": 100,
+        "calories": 980,
+        "tags": ["pizza", "high-protein", "meal"],
+    },
+    {
+        "title": "Whey Protein Powder (2lb)",
+        "description": "Ultra-filtered whey with 24g protein per scoop. Mixes instantly.",
+        "price": 29.99,
+        "category": "powder",
+        "in_stock": True,
+        "image": "https://images.unsplash.com/photo-1517673400267-0251440c45dc",
+        "protein_grams": 24,
+        "calories": 120,
+        "tags": ["powder", "whey", "shake"],
+    },
+    {
+        "title": "Vegan Protein Blend (2lb)",
+        "description": "Pea + rice protein for a complete amino acid profile.",
+        "price": 32.99,
+        "category": "powder",
+        "in_stock": True,
+        "image": "https://images.unsplash.com/photo-1517957754645-708b06a1bbb2",
+        "protein_grams": 22,
+        "calories": 110,
+        "tags": ["vegan", "powder"],
+    },
+    {
+        "title": "Protein Cookies (12-pack)",
+        "description": "Soft-baked cookies with 16g protein per cookie.",
+        "price": 19.99,
+        "category": "snack",
+        "in_stock": True,
+        "image": "https://images.unsplash.com/photo-1547414362-527f27b7b797",
+        "protein_grams": 16,
+        "calories": 220,
+        "tags": ["snack", "cookie"],
+    },
+]))
+
 @app.post("/api/seed")
-def seed_products():
+async def seed_products():
     try:
-        existing = get_documents("product", {}, 1)
+        existing = await get_documents("product", {}, 1)
         if existing:
             return {"message": "Products already seeded"}
-        sample_products = [
-            Product(
-                title="Protein Pizza (100g Protein)",
-                description="Stone-baked high-protein pizza with 100g protein per pie. Crispy crust, low-carb.",
-                price=14.99,
-                category="food",
-                in_stock=True,
-                image="https://images.unsplash.com/photo-1542281286-9e0a16bb7366",
-                protein_grams=100,
-                calories=980,
-                tags=["pizza","high-protein","meal"]
-            ),
-            Product(
-                title="Whey Protein Powder (2lb)",
-                description="Ultra-filtered whey with 24g protein per scoop. Mixes instantly.",
-                price=29.99,
-                category="powder",
-                in_stock=True,
-                image="https://images.unsplash.com/photo-1517673400267-0251440c45dc",
-                protein_grams=24,
-                calories=120,
-                tags=["powder","whey","shake"]
-            ),
-            Product(
-                title="Vegan Protein Blend (2lb)",
-                description="Pea + rice protein for a complete amino acid profile.",
-                price=32.99,
-                category="powder",
-                in_stock=True,
-                image="https://images.unsplash.com/photo-1517957754645-708b06a1bbb2",
-                protein_grams=22,
-                calories=110,
-                tags=["vegan","powder"]
-            ),
-            Product(
-                title="Protein Cookies (12-pack)",
-                description="Soft-baked cookies with 16g protein per cookie.",
-                price=19.99,
-                category="snack",
-                in_stock=True,
-                image="https://images.unsplash.com/photo-1547414362-527f27b7b797",
-                protein_grams=16,
-                calories=220,
-                tags=["snack","cookie"]
-            )
-        ]
-        for p in sample_products:
-            create_document("product", p)
-        return {"message": "Seeded sample products"}
+        inserted_ids = await create_documents("product", list(SAMPLE_PRODUCTS))
+        invalidate_product_caches()
+        return {"message": "Seeded sample products", "ids": inserted_ids}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ---------------------- Orders ----------------------
 
 @app.post("/api/orders")
-def create_order(order: Order):
+async def create_order(order: Order):
     try:
-        order_id = create_document("order", order)
+        order_id = await create_document("order", order)
         return {"id": order_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -11,8 +11,9 @@ Model name is converted to lowercase for the collection name:
 - BlogPost -> "blogs" collection
 """
 
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from dataclasses import dataclass
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Annotated, Optional, List
 
 class User(BaseModel):
     """
@@ -40,11 +41,19 @@ class Product(BaseModel):
     calories: Optional[int] = Field(None, ge=0, description="Calories per serving")
     tags: Optional[List[str]] = Field(default=None, description="Searchable tags")
 
-class OrderItem(BaseModel):
-    product_id: str = Field(..., description="Referenced product _id as string")
-    title: str = Field(..., description="Snapshot of product title")
-    price: float = Field(..., ge=0, description="Unit price at time of order")
-    quantity: int = Field(..., ge=1, description="Quantity ordered")
+@dataclass(slots=True)
+class OrderItem:
+    """
+    Order line item. A slots dataclass instead of a full model: large orders
+    validate many of these, and slots instances skip the per-item __dict__.
+    """
+    product_id: Annotated[str, Field(description="Referenced product _id as string")]
+    title: Annotated[str, Field(description="Snapshot of product title")]
+    price: Annotated[float, Field(ge=0, description="Unit price at time of order")]
+    quantity: Annotated[int, Field(ge=1, description="Quantity ordered")]
+
+# Shared adapter for validating item lists outside an Order in one batched call
+order_items_adapter = TypeAdapter(List[OrderItem])
 
 class Order(BaseModel):
     """Orders collection schema (collection name: order)"""